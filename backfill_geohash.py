@@ -0,0 +1,53 @@
+"""
+Backfill the `geohash` field used by the nearby NGO queries.
+
+NGOs are only found by main.py's /nearby-ngos/ once they have a geohash
+(recommendation.py computes its own from the cached locations), so run this
+after importing NGOs that were written without one:
+
+    python backfill_geohash.py
+"""
+import firebase_admin
+from firebase_admin import credentials, firestore
+from geo import encode_geohash
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+
+def backfill_geohashes(db) -> int:
+    batch = db.batch()
+    pending = 0
+    updated = 0
+
+    for ngo in db.collection('ngo').stream():
+        ngo_data = ngo.to_dict()
+        location = ngo_data.get('location') or {}
+        ngo_lat = location.get('latitude')
+        ngo_lon = location.get('longitude')
+
+        if ngo_lat is None or ngo_lon is None:
+            continue
+
+        ngo_geohash = encode_geohash(ngo_lat, ngo_lon)
+        if ngo_data.get('geohash') == ngo_geohash:
+            continue
+
+        batch.update(ngo.reference, {'geohash': ngo_geohash})
+        pending += 1
+        updated += 1
+
+        if pending == BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    return updated
+
+if __name__ == "__main__":
+    cred = credentials.Certificate('serviceAccountKey.json')
+    firebase_admin.initialize_app(cred)
+    updated = backfill_geohashes(firestore.client())
+    print(f"Updated geohash on {updated} NGOs")
@@ -0,0 +1,57 @@
+import asyncio
+
+class BatchAggregator:
+    """
+    Groups requests that arrive for the same key within a short window and
+    answers them with a single call to `handler(context, items)`, which must
+    return one result per item. The context of the first request in a batch
+    is used for the whole batch.
+    """
+
+    def __init__(self, handler, max_batch_size: int = 8, window: float = 0.25):
+        self._handler = handler
+        self._max_batch_size = max_batch_size
+        self._window = window
+        self._pending = {}
+        self._tasks = set()
+
+    async def submit(self, key, item, context):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        # Each pending batch keeps the context of the request that started it
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = ([], context)
+            loop.call_later(self._window, self._flush, key, pending)
+
+        batch = pending[0]
+        batch.append((item, future))
+        if len(batch) >= self._max_batch_size:
+            self._flush(key, pending)
+
+        return await future
+
+    def _flush(self, key, pending):
+        # The batch may already have been sent because it filled up
+        if self._pending.get(key) is not pending:
+            return
+        del self._pending[key]
+        batch, context = pending
+
+        task = asyncio.ensure_future(self._run(batch, context))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch, context):
+        try:
+            results = await self._handler(context, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
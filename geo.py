@@ -0,0 +1,132 @@
+"""Geospatial helpers shared by the NGO search endpoints."""
+from math import radians, degrees, sin, cos, asin
+from functools import lru_cache
+import geohash
+import numpy as np
+
+# Precision of the geohash stored on each NGO document (~5m cells)
+GEOHASH_PRECISION = 9
+
+# 1 degree of latitude = ~111km
+KM_PER_DEGREE = 111.32
+
+# Radius of earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+# Limits for using the equirectangular approximation. Within them it is at
+# most ~0.84% above the haversine distance, so filtering with a radius
+# widened by EQUIRECT_SLACK never drops an NGO that is really inside it.
+# (It can also be up to ~0.8% below, which only lets through extra NGOs
+# that the exact distance check then removes.) Keep the slack above the
+# overestimate.
+EQUIRECT_MAX_RADIUS_KM = 100.0
+EQUIRECT_MAX_LATITUDE = 70.0
+EQUIRECT_SLACK = 1.01
+
+# Below this many candidates the prefilter costs more than it saves, and
+# running haversine on all of them is faster
+EQUIRECT_MIN_POINTS = 1000
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    return geohash.encode(lat, lon, precision)
+
+def _cell_size_km(precision: int, lat: float):
+    """Height and width (in km) of a geohash cell at the given latitude"""
+    bits = precision * 5
+    lat_bits = bits // 2
+    lon_bits = bits - lat_bits
+    height = 180.0 / (1 << lat_bits) * KM_PER_DEGREE
+    width = 360.0 / (1 << lon_bits) * KM_PER_DEGREE * cos(radians(lat))
+    return height, width
+
+def geohash_query_bounds(lat: float, lon: float, radius: float):
+    """
+    Geohash ranges covering a circle of `radius` km around (lat, lon).
+
+    Uses the finest precision whose cells are at least `radius` km across, so
+    the cell containing the point plus its 8 neighbours cover the whole circle.
+    Returns a list of (start, end) pairs to query with `>= start` and `< end`,
+    or None if the radius is too large to be covered by geohash cells.
+    """
+    # Cells get narrower towards the poles, so size them at the far edge
+    edge_lat = min(90.0, abs(lat) + radius / KM_PER_DEGREE)
+
+    precision = 0
+    for p in range(1, GEOHASH_PRECISION + 1):
+        if min(_cell_size_km(p, edge_lat)) < radius:
+            break
+        precision = p
+
+    if precision == 0:
+        return None
+
+    cells = set(geohash.expand(geohash.encode(lat, lon, precision)))
+    return [(cell, cell + '~') for cell in sorted(cells)]
+
+def bounding_box_mask(lat: float, lon: float, radius: float,
+                      lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the points (in decimal degrees) inside the lat/lon box
+    around a circle of `radius` km. Needs no trig per point, so it is a cheap
+    filter to run before the exact distance calculation.
+    """
+    # Angular radius of the circle, and the widest longitude span it reaches
+    # (which is wider than radius / km-per-degree at the circle's own latitude)
+    d = radius / EARTH_RADIUS_KM
+    dlat_deg = degrees(d)
+
+    mask = np.abs(lats - lat) <= dlat_deg
+    if sin(d) < cos(radians(lat)):
+        dlon_deg = degrees(asin(sin(d) / cos(radians(lat))))
+        # Longitude difference wrapped to [-180, 180) across the antimeridian
+        mask &= np.abs((lons - lon + 180) % 360 - 180) <= dlon_deg
+    return mask
+
+def haversine_np(user_lat: float, user_lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Great circle distances (in km) from one point to arrays of points,
+    all in decimal degrees.
+    """
+    lat1 = radians(user_lat)
+    lon1 = radians(user_lon)
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+
+    dlat = lats - lat1
+    dlon = lons - lon1
+    a = np.sin(dlat / 2)**2 + cos(lat1) * np.cos(lats) * np.sin(dlon / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+@lru_cache(maxsize=4096)
+def user_trig(lat: float, lon: float):
+    """
+    Latitude in radians, its cosine and longitude in radians for a query
+    point. Memoized, since the same coordinates are often searched again.
+    """
+    lat_r = radians(lat)
+    return lat_r, cos(lat_r), radians(lon)
+
+def haversine_np_precomputed(user_lat: float, user_lon: float, lat_rs: np.ndarray,
+                             cos_lats: np.ndarray, lon_rs: np.ndarray) -> np.ndarray:
+    """
+    Same as haversine_np, for points given as latitude and longitude in
+    radians plus the cosine of the latitude, computed once in advance.
+    Only needs two sin calls per point.
+    """
+    lat1, cos_lat1, lon1 = user_trig(user_lat, user_lon)
+
+    dlat = lat_rs - lat1
+    dlon = lon_rs - lon1
+    a = np.sin(dlat / 2)**2 + cos_lat1 * cos_lats * np.sin(dlon / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def equirect_distance_np(lat0: float, lon0: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Approximate distances (in km) from one point to arrays of points using an
+    equirectangular projection. No per-point trig, but only accurate for
+    short distances away from the poles (see EQUIRECT_MAX_RADIUS_KM).
+    """
+    # Longitude difference wrapped to [-180, 180) across the antimeridian
+    x = np.radians((lons - lon0 + 180) % 360 - 180) * cos(radians(lat0))
+    y = np.radians(lats - lat0)
+    return EARTH_RADIUS_KM * np.hypot(x, y)
@@ -0,0 +1,30 @@
+"""
+Numba version of geo.haversine_np_precomputed, kept out of geo.py so only
+the services that use it pay for importing Numba and compiling the kernel.
+"""
+import math
+from numba import njit
+import numpy as np
+from geo import EARTH_RADIUS_KM
+
+# float32 constants, so nothing in the kernel is promoted to float64
+_F32_HALF = np.float32(0.5)
+_F32_ONE = np.float32(1.0)
+_F32_EARTH_DIAMETER_KM = np.float32(2 * EARTH_RADIUS_KM)
+
+@njit('f4[::1](f4[::1], f4[::1], f4[::1], f4, f4, f4)', fastmath=True, cache=True, boundscheck=False, nogil=True)
+def haversine_batch(lat_rs, cos_lats, lon_rs, lat1, cos_lat1, lon1):
+    """
+    Compiled version of haversine_np_precomputed for contiguous float32
+    arrays, with the query point given as user_trig's values (also as
+    float32). Runs as one loop, so it avoids NumPy's per-ufunc overhead
+    on small arrays. Releases the GIL while it runs.
+    """
+    n = lat_rs.shape[0]
+    out = np.empty(n, dtype=np.float32)
+    for i in range(n):
+        sin_dlat = math.sin((lat_rs[i] - lat1) * _F32_HALF)
+        sin_dlon = math.sin((lon_rs[i] - lon1) * _F32_HALF)
+        a = sin_dlat * sin_dlat + cos_lat1 * cos_lats[i] * sin_dlon * sin_dlon
+        out[i] = _F32_EARTH_DIAMETER_KM * math.asin(math.sqrt(min(a, _F32_ONE)))
+    return out
@@ -7,8 +7,9 @@ bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
 backlog = 2048
 
 # Worker processes
-workers = 4  # Good default for most cases
-worker_class = 'uvicorn.workers.UvicornWorker'
+# WEB_CONCURRENCY overrides gunicorn's recommended (2 x CPUs) + 1
+workers = int(os.getenv('WEB_CONCURRENCY') or (multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'uvicorn_worker.UvloopWorker'  # uvloop + httptools
 worker_connections = 1000
 timeout = 120
 keepalive = 2
@@ -1,18 +1,28 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from middleware import CORSMiddleware
+from pydantic import BaseModel, Field
+from typing import List, Optional, Tuple
 import firebase_admin
-from firebase_admin import credentials, firestore
-from math import radians, sin, cos, sqrt, atan2
+from firebase_admin import credentials, firestore_async
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-from PyPDF2 import PdfReader
+from google.generativeai import caching
 import tempfile
-import shutil
+import hashlib
+import datetime
+import aiofiles
+from cachetools import TTLCache
 import re
+import numpy as np
+from pagination import decode_cursor, paginate
+from geo import geohash_query_bounds, haversine_np, equirect_distance_np, EQUIRECT_MAX_RADIUS_KM, EQUIRECT_MAX_LATITUDE, EQUIRECT_SLACK, EQUIRECT_MIN_POINTS
+from batching import BatchAggregator
 
 # Load environment variables from .env file if it exists (local development)
 load_dotenv()
@@ -24,15 +34,8 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins temporarily for development
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"]
-)
+# Add CORS middleware (allows all origins)
+app.add_middleware(CORSMiddleware)
 
 # Initialize Firebase (optional)
 firebase_initialized = False
@@ -51,21 +54,13 @@ def initialize_firebase():
                 # Parse the JSON string to ensure it's valid
                 creds_dict = json.loads(firebase_creds_json)
                 
-                # Create a temporary file to store the credentials
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-                    json.dump(creds_dict, temp_file)
-                    temp_file_path = temp_file.name
-                
-                try:
-                    cred = credentials.Certificate(temp_file_path)
-                    firebase_admin.initialize_app(cred)
-                    db = firestore.client()
-                    firebase_initialized = True
-                    print("Firebase initialized successfully from environment variable")
-                    return True
-                finally:
-                    # Clean up the temporary file
-                    os.unlink(temp_file_path)
+                # Certificate accepts the parsed credentials directly
+                cred = credentials.Certificate(creds_dict)
+                firebase_admin.initialize_app(cred)
+                db = firestore_async.client()
+                firebase_initialized = True
+                print("Firebase initialized successfully from environment variable")
+                return True
             except json.JSONDecodeError as e:
                 print(f"Error parsing Firebase credentials JSON: {e}")
                 return False
@@ -75,7 +70,7 @@ def initialize_firebase():
             try:
                 cred = credentials.Certificate('serviceAccountKey.json')
                 firebase_admin.initialize_app(cred)
-                db = firestore.client()
+                db = firestore_async.client()
                 firebase_initialized = True
                 print("Firebase initialized successfully from serviceAccountKey.json")
                 return True
@@ -93,6 +88,26 @@ def initialize_firebase():
 # Initialize Firebase when the app starts
 initialize_firebase()
 
+GEMINI_MODEL_NAME = 'models/gemini-1.5-pro'
+
+# Safety settings and generation config used for every Gemini request
+SAFETY_SETTINGS = [
+    {"category": category, "threshold": "BLOCK_NONE"}
+    for category in (
+        "HARM_CATEGORY_HARASSMENT",
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+    )
+]
+
+GEN_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
 # Initialize Gemini AI
 def initialize_gemini():
     # Try to get API key from environment variable
@@ -106,7 +121,11 @@ def initialize_gemini():
     try:
         genai.configure(api_key=api_key)
         # Use the latest Gemini model
-        model = genai.GenerativeModel('models/gemini-1.5-pro')
+        model = genai.GenerativeModel(
+            GEMINI_MODEL_NAME,
+            safety_settings=SAFETY_SETTINGS,
+            generation_config=GEN_CONFIG
+        )
         return model
     except Exception as e:
         raise ValueError(f"Failed to initialize Gemini model: {e}")
@@ -128,37 +147,255 @@ async def health_check():
         )
     return {"status": "healthy", "model": "initialized"}
 
-def extract_text_from_pdf(file_path: str) -> str:
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error extracting text from PDF: {str(e)}")
+# Markdown patterns used by clean_markdown, compiled once at import. They
+# run one after another so nested markup (e.g. code inside bold) is
+# removed too.
+_RE_HEAD = re.compile(r'^#+\s+', re.MULTILINE)
+_RE_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_RE_ITAL = re.compile(r'\*(.*?)\*')
+_RE_FENCE = re.compile(r'```[\s\S]*?```')
+_RE_CODE = re.compile(r'`(.*?)`')
+_RE_BLANK = re.compile(r'\n\s*\n')
 
 def clean_markdown(text):
     """Remove markdown formatting and clean up the text."""
     # Remove markdown headers
-    text = re.sub(r'^#+\s+', '', text, flags=re.MULTILINE)
+    text = _RE_HEAD.sub('', text)
     
     # Remove markdown bold and italic
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-    text = re.sub(r'\*(.*?)\*', r'\1', text)
+    text = _RE_BOLD.sub(r'\1', text)
+    text = _RE_ITAL.sub(r'\1', text)
     
     # Remove markdown code blocks
-    text = re.sub(r'```[\s\S]*?```', '', text)
+    text = _RE_FENCE.sub('', text)
     
     # Remove inline code
-    text = re.sub(r'`(.*?)`', r'\1', text)
+    text = _RE_CODE.sub(r'\1', text)
     
     # Fix double line breaks
-    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = _RE_BLANK.sub('\n\n', text)
     
     return text.strip()
 
+class ThreadLimiter:
+    """
+    Runs blocking calls in its own pool of `limit` worker threads.
+    Once `max_waiting` calls are queued for a slot, new ones are rejected
+    with a 503 instead of piling up.
+    """
+    def __init__(self, limit: int, max_waiting: int):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self._semaphore = None
+        self._waiting = 0
+        # Not the event loop's default executor, which is smaller than
+        # `limit` on small machines and shared with everything else
+        self._executor = ThreadPoolExecutor(max_workers=limit)
+    
+    async def run(self, func, *args, **kwargs):
+        # Created lazily so the semaphore belongs to the server's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        
+        if self._semaphore.locked() and self._waiting >= self.max_waiting:
+            raise HTTPException(status_code=503, detail="Server is busy, please try again later")
+        
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self._semaphore.release()
+
+# Limits for blocking Gemini calls: PDF uploads, and generation / caching
+MAX_WAITING_REQUESTS = int(os.getenv('MAX_WAITING_REQUESTS', '32'))
+_pdf_limiter = ThreadLimiter(int(os.getenv('PDF_CONCURRENCY', '4')), MAX_WAITING_REQUESTS)
+_llm_limiter = ThreadLimiter(int(os.getenv('LLM_CONCURRENCY', '16')), MAX_WAITING_REQUESTS)
+
+# Uploads are written to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MB
+
+# The Gemini File API deletes uploads after 48 hours, stop reusing them a bit before
+UPLOADED_FILE_TTL = 47 * 60 * 60
+
+# Gemini only accepts context caches of at least this many tokens
+MIN_CACHED_TOKENS = 32768
+
+# How long a document stays in the Gemini context cache
+CONTEXT_CACHE_TTL = datetime.timedelta(hours=1)
+
+# PDFs already uploaded to Gemini and their context caches, keyed by the
+# SHA-256 of the PDF contents. Context caches are dropped a minute before
+# Gemini expires them.
+_uploaded_files = TTLCache(maxsize=1000, ttl=UPLOADED_FILE_TTL)
+_gemini_cache = TTLCache(maxsize=1000, ttl=CONTEXT_CACHE_TTL.total_seconds() - 60)
+
+# Documents not to put in a context cache, because they are too short or
+# creating the cache failed. Tried again once they expire.
+_uncacheable_docs = TTLCache(maxsize=10_000, ttl=60 * 60)
+
+# The caches above are used from worker threads, and cachetools caches
+# aren't thread safe
+_doc_caches_lock = threading.Lock()
+
+# Held while creating a document's context cache. A fixed set of locks,
+# picked by document hash, so there is no per-document lock to clean up.
+_cache_create_locks = [threading.Lock() for _ in range(64)]
+
+# Answers already given, keyed by document hash and normalized question
+_answer_cache = TTLCache(maxsize=10_000, ttl=60 * 60)
+
+def _cache_get(cache: TTLCache, doc_hash: str):
+    with _doc_caches_lock:
+        return cache.get(doc_hash)
+
+def _cache_set(cache: TTLCache, doc_hash: str, value):
+    with _doc_caches_lock:
+        cache[doc_hash] = value
+
+def get_uploaded_file(doc_hash: str):
+    """Return the Gemini file for a previously uploaded PDF, if it is still available"""
+    return _cache_get(_uploaded_files, doc_hash)
+
+def _create_document_cache(doc_hash: str, uploaded_file):
+    """
+    Put a document in a Gemini context cache if it is large enough, and
+    return the cached content (None for small documents or on errors)
+    """
+    # Concurrent first questions about a document wait here for the one
+    # creating its cache, instead of each creating (and paying for) another
+    with _cache_create_locks[hash(doc_hash) % len(_cache_create_locks)]:
+        cached_content = _cache_get(_gemini_cache, doc_hash)
+        if cached_content is not None or _cache_get(_uncacheable_docs, doc_hash):
+            return cached_content
+        
+        if model.count_tokens([uploaded_file]).total_tokens < MIN_CACHED_TOKENS:
+            _cache_set(_uncacheable_docs, doc_hash, True)
+            return None
+        
+        try:
+            cached_content = caching.CachedContent.create(
+                model=GEMINI_MODEL_NAME,
+                contents=[uploaded_file],
+                ttl=CONTEXT_CACHE_TTL
+            )
+        except Exception as e:
+            # Remembered, so later questions don't retry it every time
+            print(f"Error creating Gemini context cache: {e}")
+            _cache_set(_uncacheable_docs, doc_hash, True)
+            return None
+        
+        _cache_set(_gemini_cache, doc_hash, cached_content)
+        return cached_content
+
+def get_document_model(doc_hash: str, uploaded_file):
+    """
+    Get the model to ask questions about a document with, and the contents
+    to send before the question. Large documents are put in a Gemini context
+    cache once, so later questions don't re-send the whole document.
+    """
+    cached_content = _cache_get(_gemini_cache, doc_hash)
+    
+    if cached_content is None and not _cache_get(_uncacheable_docs, doc_hash):
+        cached_content = _create_document_cache(doc_hash, uploaded_file)
+    
+    if cached_content is not None:
+        doc_model = genai.GenerativeModel.from_cached_content(
+            cached_content=cached_content,
+            safety_settings=SAFETY_SETTINGS,
+            generation_config=GEN_CONFIG
+        )
+        return doc_model, []
+    return model, [uploaded_file]
+
+def generate_answer(doc_model, doc_contents: list, prompt: str) -> str:
+    """Ask Gemini about a document and return the answer without markdown"""
+    # Safety settings and generation config are set on the model itself
+    response = doc_model.generate_content(doc_contents + [prompt])
+    
+    # Clean any remaining markdown from the response
+    return clean_markdown(response.text)
+
+def answer_question(doc_model, doc_contents: list, question: str) -> str:
+    # Prepare prompt for Gemini
+    prompt = f"""Based on the attached document, please answer this question: {question}
+
+Please provide your answer in plain text format without markdown formatting.
+"""
+    return generate_answer(doc_model, doc_contents, prompt)
+
+# Matches the "[[1]]" markers starting each answer of a batched prompt. They
+# are unlike a numbered list, so lists inside an answer aren't split up.
+_RE_ANSWER_NUMBER = re.compile(r'^\s*\[\[(\d+)\]\]\s*', re.MULTILINE)
+
+# "[" followed by another "[", to break up markers inside a question
+_RE_DOUBLE_BRACKET = re.compile(r'\[(?=\[)')
+
+def _batch_question(question: str) -> str:
+    """
+    A question as it appears in a batched prompt: on one line, with "[["
+    broken up, so it can't start its own numbered question or answer
+    """
+    return _RE_DOUBLE_BRACKET.sub('[ ', " ".join(question.split()))
+
+def split_numbered_answers(response: str, count: int) -> dict:
+    """
+    Answers from a batched response, keyed by question number. Only the
+    marker for the next expected question is accepted, so a repeated or out
+    of order marker stays part of the answer it appears in.
+    """
+    answers = {}
+    number, start = 0, None
+    for match in _RE_ANSWER_NUMBER.finditer(response):
+        if number == count or int(match.group(1)) != number + 1:
+            continue
+        if start is not None:
+            answers[number] = response[start:match.start()].strip()
+        number, start = number + 1, match.end()
+    if start is not None:
+        answers[number] = response[start:].strip()
+    return answers
+
+async def answer_questions(context, questions: List[str]) -> List[Tuple[str, bool]]:
+    """
+    Answer several questions about one document with a single Gemini call.
+    Returns (answer, asked_alone) pairs: an answer read from the combined
+    response can be swayed by the other users' questions in the batch.
+    """
+    doc_model, doc_contents = context
+    if len(questions) == 1:
+        return [(await _llm_limiter.run(answer_question, doc_model, doc_contents, questions[0]), True)]
+    
+    numbered = "\n".join(f"[[{i}]] {_batch_question(question)}" for i, question in enumerate(questions, 1))
+    prompt = f"""Based on the attached document, answer each numbered question below.
+Start each answer on a new line with the number of its question in double brackets, for example "[[1]] ...".
+
+{numbered}
+
+Please provide your answers in plain text format without markdown formatting.
+"""
+    response = await _llm_limiter.run(generate_answer, doc_model, doc_contents, prompt)
+    answers = split_numbered_answers(response, len(questions))
+    
+    # Ask separately, all at once, for anything that couldn't be read from the combined answer
+    missing = [i for i in range(1, len(questions) + 1) if not answers.get(i)]
+    retried = await asyncio.gather(*(
+        _llm_limiter.run(answer_question, doc_model, doc_contents, questions[i - 1]) for i in missing
+    ))
+    answers.update(zip(missing, retried))
+    return [(answers[i], i in missing) for i in range(1, len(questions) + 1)]
+
+# Batch questions asked about the same document within a short window.
+# Disable with CHAT_BATCHING=false; long questions are always asked alone.
+CHAT_BATCHING = os.getenv('CHAT_BATCHING', 'true').lower() == 'true'
+BATCH_MAX_QUESTION_LENGTH = 200
+_question_batcher = BatchAggregator(answer_questions, max_batch_size=8, window=0.25)
+
 @app.post("/chat-with-pdf/")
 async def chat_with_pdf(
     file: UploadFile = File(...),
@@ -168,80 +405,66 @@ async def chat_with_pdf(
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
-    temp_dir = tempfile.mkdtemp()  # Create a temporary directory
-    temp_file_path = os.path.join(temp_dir, "temp.pdf")
-    
     try:
-        # Save uploaded file to temporary directory
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # The temporary directory and its contents are removed on exit
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_file_path = os.path.join(temp_dir, "temp.pdf")
+            
+            # Stream the upload to disk without blocking the event loop,
+            # hashing it on the way so repeated documents can be recognised
+            sha256 = hashlib.sha256()
+            async with aiofiles.open(temp_file_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    await buffer.write(chunk)
+            doc_hash = sha256.hexdigest()
+            
+            # Same question about the same document: answer from the cache
+            answer_key = f"{doc_hash}:{question.strip().lower()}"
+            cached_answer = _answer_cache.get(answer_key)
+            if cached_answer is not None:
+                return {
+                    "answer": cached_answer,
+                    "status": "success"
+                }
+            
+            # Gemini reads the PDF itself, so it only has to be uploaded once
+            uploaded_file = get_uploaded_file(doc_hash)
+            if uploaded_file is None:
+                uploaded_file = await _pdf_limiter.run(genai.upload_file, temp_file_path, mime_type='application/pdf')
+                _cache_set(_uploaded_files, doc_hash, uploaded_file)
         
-        # Extract text from PDF
-        pdf_text = extract_text_from_pdf(temp_file_path)
+        doc_model, doc_contents = await _llm_limiter.run(get_document_model, doc_hash, uploaded_file)
         
-        # Prepare prompt for Gemini
-        prompt = f"""Based on the following document, please answer this question: {question}
-
-Document content:
-{pdf_text}
-
-Please provide your answer in plain text format without markdown formatting.
-"""
-
-        # Get response from Gemini with safety settings
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE",
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE",
-            },
-        ]
-        
-        response = model.generate_content(
-            prompt,
-            safety_settings=safety_settings,
-            generation_config={
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 2048,
-            }
-        )
+        # Short questions about the same document are answered together
+        if CHAT_BATCHING and len(question) <= BATCH_MAX_QUESTION_LENGTH:
+            cleaned_response, asked_alone = await _question_batcher.submit(doc_hash, question, (doc_model, doc_contents))
+        else:
+            cleaned_response = await _llm_limiter.run(answer_question, doc_model, doc_contents, question)
+            asked_alone = True
         
-        # Clean any remaining markdown from the response
-        cleaned_response = clean_markdown(response.text)
+        # Answers from a combined prompt depend on the other questions in it,
+        # so only answers to questions asked alone are shared through the cache
+        if asked_alone:
+            _answer_cache[answer_key] = cleaned_response
         
         return {
             "answer": cleaned_response,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        # Clean up: remove temporary directory and its contents
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            print(f"Error cleaning up temporary files: {e}")
 
 # Models for recommendation system
 class LocationRequest(BaseModel):
     latitude: float
     longitude: float
     radius: Optional[float] = 50.0
+    limit: int = Field(50, ge=1, le=200)
+    cursor: Optional[str] = None
 
 class NGOResponse(BaseModel):
     ngo_id: str
@@ -253,81 +476,99 @@ class NGOResponse(BaseModel):
     logoUrl: Optional[str] = None
     ngoRating: Optional[float] = None
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    r = 6371
-    return c * r
+class NGOPage(BaseModel):
+    items: List[NGOResponse]
+    next_cursor: Optional[str] = None
+
+# NGO document fields returned by /nearby-ngos/ (see NGOResponse)
+NGO_FIELDS = ['ngoName', 'location', 'description', 'contact', 'logoUrl', 'ngoRating']
 
-def get_nearby_ngos(user_lat: float, user_lon: float, radius: float = 50) -> List[dict]:
+async def _stream_located_ngos(query, docs: list):
+    """Add the NGOs returned by `query` that have a location to `docs`, as (snapshot, data) pairs"""
+    async for ngo in query.stream():
+        ngo_data = ngo.to_dict()
+        if 'location' not in ngo_data:
+            continue
+        
+        ngo_lat = ngo_data['location'].get('latitude')
+        ngo_lon = ngo_data['location'].get('longitude')
+        
+        if ngo_lat is None or ngo_lon is None:
+            continue
+        
+        docs.append((ngo, ngo_data))
+
+async def get_nearby_ngos(user_lat: float, user_lon: float, radius: float = 50, offset: int = 0, limit: int = 50) -> dict:
     if not firebase_initialized:
-        return []  # Return empty list if Firebase is not initialized
+        return paginate([], offset, limit)  # No NGOs if Firebase is not initialized
     try:
         ngo_ref = db.collection('ngo')
         
-        # Calculate the rough bounding box for the search radius
-        # 1 degree of latitude = ~111km
-        lat_range = radius / 111.0
-        # 1 degree of longitude = ~111km * cos(latitude)
-        lon_range = radius / (111.0 * cos(radians(user_lat)))
-        
-        # Query NGOs within the bounding box first
-        ngos = ngo_ref.where('location.latitude', '>=', user_lat - lat_range)\
-                     .where('location.latitude', '<=', user_lat + lat_range)\
-                     .limit(100)  # Limit the number of results for performance
+        # Only fetch NGOs whose geohash falls in the cells covering the radius
+        # (see backfill_geohash.py), and only the fields we return
+        bounds = geohash_query_bounds(user_lat, user_lon, radius)
+        if bounds is not None:
+            queries = [
+                ngo_ref.where('geohash', '>=', start).where('geohash', '<', end).select(NGO_FIELDS)
+                for start, end in bounds
+            ]
+        else:
+            # Radius too large for geohash cells, query the rough latitude
+            # range instead (1 degree of latitude = ~111km)
+            lat_range = radius / 111.0
+            queries = [
+                ngo_ref.where('location.latitude', '>=', user_lat - lat_range)
+                       .where('location.latitude', '<=', user_lat + lat_range)
+                       .select(NGO_FIELDS)
+            ]
         
         nearby_ngos = []
-        # Use a timeout for the query execution
+        # Process NGOs as they arrive while the rest are still streaming in,
+        # with all the queries running at once
+        docs = []
         try:
-            ngo_docs = ngos.get(timeout=30)  # 30 second timeout
+            await asyncio.gather(*(_stream_located_ngos(query, docs) for query in queries))
         except Exception as e:
-            print(f"Query timeout or error: {e}")
-            return []
-            
-        for ngo in ngo_docs:
-            ngo_data = ngo.to_dict()
-            if 'location' not in ngo_data:
-                continue
-            
-            ngo_lat = ngo_data['location'].get('latitude')
-            ngo_lon = ngo_data['location'].get('longitude')
-            
-            if ngo_lat is None or ngo_lon is None:
-                continue
-            
-            # Only calculate distance for NGOs within the longitude range
-            if abs(ngo_lon - user_lon) <= lon_range:
-                distance = haversine_distance(user_lat, user_lon, ngo_lat, ngo_lon)
-                
-                if distance <= radius:
-                    ngo_info = {
-                        'ngo_id': ngo.id,
-                        'ngoName': ngo_data.get('ngoName', 'Unknown'),
-                        'distance': round(distance, 2),
-                        'location': ngo_data['location'],
-                        'description': ngo_data.get('description'),
-                        'contact': ngo_data.get('contact'),
-                        'logoUrl': ngo_data.get('logoUrl'),
-                        'ngoRating': ngo_data.get('ngoRating'),
-                        **ngo_data
-                    }
-                    nearby_ngos.append(ngo_info)
+            print(f"Query error: {e}")
+            return paginate([], offset, limit)
         
-        nearby_ngos.sort(key=lambda x: x['distance'])
-        return nearby_ngos[:50]  # Limit results to 50 NGOs
+        lats = np.fromiter((d['location']['latitude'] for _, d in docs), dtype=np.float64, count=len(docs))
+        lons = np.fromiter((d['location']['longitude'] for _, d in docs), dtype=np.float64, count=len(docs))
+        
+        # For small radii and many NGOs, drop far away ones with the cheap
+        # equirectangular distance first and only compute exact distances
+        # for the rest
+        if (len(docs) >= EQUIRECT_MIN_POINTS and radius <= EQUIRECT_MAX_RADIUS_KM
+                and abs(user_lat) <= EQUIRECT_MAX_LATITUDE):
+            candidates = np.nonzero(equirect_distance_np(user_lat, user_lon, lats, lons) <= radius * EQUIRECT_SLACK)[0]
+        else:
+            candidates = np.arange(len(docs))
+        distances = haversine_np(user_lat, user_lon, lats[candidates], lons[candidates])
+        
+        for j in np.nonzero(distances <= radius)[0]:
+            ngo, ngo_data = docs[candidates[j]]
+            ngo_info = {
+                **ngo_data,
+                'ngo_id': ngo.id,
+                'ngoName': ngo_data.get('ngoName', 'Unknown'),
+                'distance': round(float(distances[j]), 2)
+            }
+            nearby_ngos.append(ngo_info)
+        
+        # The queries return NGOs in no particular order, so break distance
+        # ties by id to page through them the same way on every request
+        nearby_ngos.sort(key=lambda x: (x['distance'], x['ngo_id']))
+        return paginate(nearby_ngos, offset, limit)
         
     except Exception as e:
         print(f"Error getting nearby NGOs: {e}")
-        return []
+        return paginate([], offset, limit)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to NGO Connect API"}
 
-@app.post("/nearby-ngos/", response_model=List[NGOResponse])
+@app.post("/nearby-ngos/", response_model=NGOPage)
 async def find_nearby_ngos(request: LocationRequest):
     """Get nearby NGOs based on user location"""
     if not firebase_initialized:
@@ -338,12 +579,10 @@ async def find_nearby_ngos(request: LocationRequest):
                 detail="Firebase is not initialized. Please check server configuration."
             )
     
+    offset = decode_cursor(request.cursor)
+    
     try:
-        nearby = get_nearby_ngos(request.latitude, request.longitude, request.radius)
-        if not nearby:
-            # Return empty list with 200 status if no NGOs found
-            return []
-        return nearby
+        return await get_nearby_ngos(request.latitude, request.longitude, request.radius, offset, request.limit)
     except Exception as e:
         print(f"Error in find_nearby_ngos: {str(e)}")  # Log the error
         raise HTTPException(
@@ -0,0 +1,52 @@
+class CORSMiddleware:
+    """
+    Pure ASGI CORS middleware allowing every origin, with credentials.
+
+    The CORS headers are added straight to the `http.response.start` message
+    and preflight requests are answered here without reaching the app.
+    """
+
+    allow_methods = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+    max_age = b"600"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_headers = dict(scope["headers"])
+        origin = request_headers.get(b"origin")
+        if origin is None:
+            return await self.app(scope, receive, send)
+
+        # Browsers reject "*" when credentials are allowed, so echo the origin back
+        cors_headers = [
+            (b"access-control-allow-origin", origin),
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin"),
+        ]
+
+        if scope["method"] == "OPTIONS" and b"access-control-request-method" in request_headers:
+            headers = cors_headers + [
+                (b"access-control-allow-methods", self.allow_methods),
+                (b"access-control-max-age", self.max_age),
+            ]
+            requested_headers = request_headers.get(b"access-control-request-headers")
+            if requested_headers:
+                headers.append((b"access-control-allow-headers", requested_headers))
+
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.extend(cors_headers)
+                headers.append((b"access-control-expose-headers", b"*"))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
@@ -0,0 +1,27 @@
+import base64
+import binascii
+from typing import Optional
+from fastapi import HTTPException
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """Get the offset a cursor points at, 0 if there is no cursor"""
+    if not cursor:
+        return 0
+    try:
+        offset = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        offset = -1
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+def paginate(items: list, offset: int, limit: int) -> dict:
+    """Slice one page out of `items`, with the cursor of the next page if there is one"""
+    end = offset + limit
+    return {
+        "items": items[offset:end],
+        "next_cursor": encode_cursor(end) if end < len(items) else None
+    }
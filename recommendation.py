@@ -1,37 +1,85 @@
 import firebase_admin
-from firebase_admin import credentials, firestore
-from math import radians, sin, cos, sqrt, atan2
+from firebase_admin import credentials, firestore_async
+from array import array
+import asyncio
+from bisect import bisect_left
 import json
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+import os
+import time
+import hmac
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import ORJSONResponse
+from middleware import CORSMiddleware
+from pydantic import BaseModel, Field
 from typing import List, Optional
+from pagination import decode_cursor, encode_cursor
+from geo import bounding_box_mask, encode_geohash, geohash_query_bounds, haversine_np_precomputed, user_trig
+import numpy as np
+
+try:
+    from geo_jit import haversine_batch
+except ImportError:  # Numba is optional, the NumPy version is used without it
+    haversine_batch = None
 
 # Initialize FastAPI
 app = FastAPI(
     title="NGO Recommendation API",
     description="API for getting nearby NGOs based on user location",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods
-    allow_headers=["*"],  # Allows all headers
-)
+# Add CORS middleware (allows all origins)
+app.add_middleware(CORSMiddleware)
+
+# Firestore client, created at startup (see load_ngo_cache)
+db = None
+
+NGO_COLLECTION = 'ngo'
+
+# NGOs are cached in-process and reloaded from Firebase after this many seconds
+NGO_CACHE_TTL = float(os.getenv('NGO_CACHE_TTL', '60'))
+
+# Token required by the admin endpoints in the X-Admin-Token header; they
+# are disabled when it isn't set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Fields returned for each NGO, the only ones read from Firestore
+NGO_FIELDS = ['ngoId', 'ngoName', 'location', 'description', 'email', 'phone', 'logoUrl', 'categories',
+              'displayType', 'district', 'state', 'isVerified', 'mission', 'vision']
 
-# Initialize Firebase
-cred = credentials.Certificate('serviceAccountKey.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Below this many candidates the Numba kernel is faster than NumPy. Past
+# the crossover (measured at ~750-1500 depending on the machine) NumPy's
+# vectorized ufuncs win.
+JIT_MAX_POINTS = 1000
+
+# Cached snapshot of the NGO collection, with coordinates stored as arrays
+_ngo_cache = {'ts': 0.0, 'data': None, 'generation': 0}
+_ngo_cache_lock = None
+_ngo_refresh_task = None
+
+@app.on_event("startup")
+async def load_ngo_cache():
+    # Initialize Firebase here rather than at import, so each worker process
+    # gets its own client on its own event loop
+    global db, _ngo_cache_lock
+    if not firebase_admin._apps:
+        cred = credentials.Certificate('serviceAccountKey.json')
+        firebase_admin.initialize_app(cred)
+    db = firestore_async.client()
+    
+    # Created here so the lock belongs to the server's event loop
+    _ngo_cache_lock = asyncio.Lock()
+    
+    # Load the NGOs before the first request needs them
+    await _try_refresh_ngos()
 
 class LocationRequest(BaseModel):
     latitude: float
     longitude: float
     radius: Optional[float] = 50.0
+    limit: int = Field(50, ge=1, le=200)
+    cursor: Optional[str] = None
 
 class NGOResponse(BaseModel):
     ngo_id: str
@@ -50,79 +98,193 @@ class NGOResponse(BaseModel):
     mission: Optional[str] = None
     vision: Optional[str] = None
 
-def haversine_distance(lat1, lon1, lat2, lon2):
+class NGOPage(BaseModel):
+    total: int
+    items: List[NGOResponse]
+    next_cursor: Optional[str] = None
+
+async def _fetch_ngos() -> dict:
     """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
+    Read the NGO collection from Firebase into the cached snapshot layout:
+    contiguous latitude / longitude arrays for the distance calculation, and
+    a parallel list with each NGO's response fields (everything but distance)
     """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    # Radius of earth in kilometers
-    r = 6371
-    return c * r
-
-def get_nearby_ngos(user_lat: float, user_lon: float, radius: float = 50) -> List[dict]:
+    ngos = db.collection(NGO_COLLECTION).select(NGO_FIELDS)
+    
+    # The number of NGOs isn't known until the stream ends, so the
+    # coordinates are collected in growable C double arrays
+    lats = array('d')
+    lons = array('d')
+    meta = []
+    async for ngo in ngos.stream():
+        ngo_data = ngo.to_dict()
+        
+        # Skip if NGO doesn't have location data
+        if 'location' not in ngo_data:
+            continue
+            
+        ngo_lat = ngo_data['location'].get('latitude')
+        ngo_lon = ngo_data['location'].get('longitude')
+        
+        if ngo_lat is None or ngo_lon is None:
+            continue
+        
+        lats.append(ngo_lat)
+        lons.append(ngo_lon)
+        meta.append({
+            'ngo_id': ngo_data.get('ngoId', ngo.id),  # Use ngoId from data or fallback to document ID
+            'ngoName': ngo_data.get('ngoName', 'Unknown'),
+            'location': {
+                'latitude': ngo_lat,
+                'longitude': ngo_lon,
+                'address': ngo_data['location'].get('address', '')
+            },
+            'description': ngo_data.get('description'),
+            'email': ngo_data.get('email'),
+            'phone': ngo_data.get('phone'),
+            'logoUrl': ngo_data.get('logoUrl', ''),
+            'categories': ngo_data.get('categories', []),
+            'displayType': ngo_data.get('displayType'),
+            'district': ngo_data.get('district'),
+            'state': ngo_data.get('state'),
+            'isVerified': ngo_data.get('isVerified'),
+            'mission': ngo_data.get('mission'),
+            'vision': ngo_data.get('vision')
+        })
+    
+    # Sort everything by geohash so the NGOs in a geohash cell form one
+    # contiguous run of indices
+    lats = np.frombuffer(lats, dtype=np.float64)
+    lons = np.frombuffer(lons, dtype=np.float64)
+    lat_rs = np.radians(lats)
+    geohashes = [encode_geohash(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    order = sorted(range(len(meta)), key=geohashes.__getitem__)
+    
+    # float32 is precise to well under a metre here and halves the memory
+    # the distance calculation reads
+    return {
+        'lats': lats[order].astype(np.float32),
+        'lons': lons[order].astype(np.float32),
+        # NGO locations only change on refresh, so their trig is done once here
+        'lat_rs': lat_rs[order].astype(np.float32),
+        'cos_lats': np.cos(lat_rs)[order].astype(np.float32),
+        'lon_rs': np.radians(lons)[order].astype(np.float32),
+        'meta': [meta[i] for i in order],
+        'geohashes': [geohashes[i] for i in order],
+    }
+
+def _candidate_indices(ngos: dict, user_lat: float, user_lon: float, radius: float) -> np.ndarray:
     """
-    Get NGOs sorted by distance from user location
+    Indices of the cached NGOs in the geohash cells covering the search
+    circle, found by binary search over the sorted geohashes. Falls back to
+    every NGO when the radius is too large for geohash cells.
     """
-    try:
-        # Get all NGOs from Firebase
-        ngo_ref = db.collection('ngo')
-        ngos = ngo_ref.get()
+    bounds = geohash_query_bounds(user_lat, user_lon, radius)
+    if bounds is None:
+        return np.arange(len(ngos['meta']))
+    
+    geohashes = ngos['geohashes']
+    return np.concatenate([
+        np.arange(bisect_left(geohashes, start), bisect_left(geohashes, end))
+        for start, end in bounds
+    ])
+
+async def _refresh_ngos() -> dict:
+    async with _ngo_cache_lock:
+        # Another request may have reloaded the cache while we were waiting
+        if _ngo_cache['data'] is not None and time.monotonic() - _ngo_cache['ts'] < NGO_CACHE_TTL:
+            return _ngo_cache['data']
         
-        nearby_ngos = []
+        generation = _ngo_cache['generation']
+        ngos = await _fetch_ngos()
         
-        for ngo in ngos:
-            ngo_data = ngo.to_dict()
-            
-            # Skip if NGO doesn't have location data
-            if 'location' not in ngo_data:
-                continue
-                
-            ngo_lat = ngo_data['location'].get('latitude')
-            ngo_lon = ngo_data['location'].get('longitude')
-            
-            if ngo_lat is None or ngo_lon is None:
-                continue
-            
-            # Calculate distance
-            distance = haversine_distance(user_lat, user_lon, ngo_lat, ngo_lon)
-            
-            # Only include NGOs within the specified radius
-            if distance <= radius:
-                ngo_info = {
-                    'ngo_id': ngo_data.get('ngoId', ngo.id),  # Use ngoId from data or fallback to document ID
-                    'ngoName': ngo_data.get('ngoName', 'Unknown'),
-                    'distance': round(distance, 2),
-                    'location': {
-                        'latitude': ngo_lat,
-                        'longitude': ngo_lon,
-                        'address': ngo_data['location'].get('address', '')
-                    },
-                    'description': ngo_data.get('description'),
-                    'email': ngo_data.get('email'),
-                    'phone': ngo_data.get('phone'),
-                    'logoUrl': ngo_data.get('logoUrl', ''),
-                    'categories': ngo_data.get('categories', []),
-                    'displayType': ngo_data.get('displayType'),
-                    'district': ngo_data.get('district'),
-                    'state': ngo_data.get('state'),
-                    'isVerified': ngo_data.get('isVerified'),
-                    'mission': ngo_data.get('mission'),
-                    'vision': ngo_data.get('vision')
-                }
-                nearby_ngos.append(ngo_info)
-        
-        # Sort NGOs by distance
-        nearby_ngos.sort(key=lambda x: x['distance'])
+        # Don't overwrite an invalidation that happened during the fetch
+        if _ngo_cache['generation'] == generation:
+            _ngo_cache['data'] = ngos
+            _ngo_cache['ts'] = time.monotonic()
+        return ngos
+
+async def _try_refresh_ngos():
+    try:
+        await _refresh_ngos()
+    except Exception as e:
+        print(f"Error refreshing NGO cache: {e}")
+
+async def _load_ngos() -> dict:
+    """
+    Get the cached NGO snapshot. Once it is older than NGO_CACHE_TTL seconds
+    it is reloaded in the background while requests keep using the old one,
+    so only the very first load (or one after invalidation) waits on Firebase.
+    """
+    global _ngo_refresh_task
+    if _ngo_cache['data'] is None:
+        return await _refresh_ngos()
+    
+    if time.monotonic() - _ngo_cache['ts'] >= NGO_CACHE_TTL:
+        if _ngo_refresh_task is None or _ngo_refresh_task.done():
+            _ngo_refresh_task = asyncio.create_task(_try_refresh_ngos())
+    
+    return _ngo_cache['data']
+
+def _compute_nearby(ngos: dict, user_lat: float, user_lon: float, radius: float, offset: int, limit: int) -> dict:
+    """
+    Page of cached NGOs within `radius` km of the user, sorted by distance
+    """
+    # Look up the NGOs in nearby geohash cells, then a cheap bounding box
+    # filter, so haversine only runs on NGOs that can be inside the radius
+    candidates = _candidate_indices(ngos, user_lat, user_lon, radius)
+    in_box = bounding_box_mask(user_lat, user_lon, radius, ngos['lats'][candidates], ngos['lons'][candidates])
+    candidates = candidates[in_box]
+    
+    # Calculate the remaining distances in one vectorized pass, with the
+    # Numba kernel when there are few enough of them
+    lat_rs = ngos['lat_rs'][candidates]
+    cos_lats = ngos['cos_lats'][candidates]
+    lon_rs = ngos['lon_rs'][candidates]
+    if haversine_batch is not None and len(candidates) < JIT_MAX_POINTS:
+        distances = haversine_batch(lat_rs, cos_lats, lon_rs, *map(np.float32, user_trig(user_lat, user_lon)))
+    else:
+        distances = haversine_np_precomputed(user_lat, user_lon, lat_rs, cos_lats, lon_rs)
+    
+    # Only include NGOs within the specified radius, sorted by distance.
+    # Only the NGOs up to the end of the requested page need sorting, so
+    # when there are more, keep just those no further than the NGO at the
+    # end of the page (including every NGO tied with it).
+    within = np.nonzero(distances <= radius)[0]
+    end = offset + limit
+    if len(within) > end:
+        cutoff = np.partition(distances[within], end - 1)[end - 1]
+        within_top = within[distances[within] <= cutoff]
+    else:
+        within_top = within
+    # Ties are ordered by index, so every request pages through them the same way
+    order = within_top[np.lexsort((within_top, distances[within_top]))]
+    
+    # The response dicts were assembled when the cache was built, so each
+    # one only needs its distance added
+    meta = ngos['meta']
+    nearby_ngos = [
+        {**meta[candidates[i]], 'distance': round(float(distances[i]), 2)}
+        for i in order[offset:end].tolist()
+    ]
+    
+    return {
+        'total': len(within),
+        'items': nearby_ngos,
+        'next_cursor': encode_cursor(end) if end < len(within) else None
+    }
+
+async def get_nearby_ngos(user_lat: float, user_lon: float, radius: float = 50, offset: int = 0, limit: int = 50) -> dict:
+    """
+    Get NGOs sorted by distance from user location
+    """
+    try:
+        ngos = await _load_ngos()
         
-        return nearby_ngos
+        # The NumPy work and the Numba kernel (nogil) release the GIL, so in
+        # a thread they can overlap with other requests instead of blocking
+        # the event loop
+        return await asyncio.to_thread(_compute_nearby, ngos, user_lat, user_lon, radius, offset, limit)
         
     except Exception as e:
         print(f"Error getting nearby NGOs: {e}")  # Log the error
@@ -132,7 +294,23 @@ def get_nearby_ngos(user_lat: float, user_lon: float, radius: float = 50) -> Lis
 async def root():
     return {"message": "Welcome to NGO Recommendation API"}
 
-@app.post("/nearby-ngos/", response_model=List[NGOResponse])
+@app.post("/admin/invalidate-ngos")
+async def invalidate_ngos(x_admin_token: Optional[str] = Header(None)):
+    """
+    Drop the cached NGOs so the next request reloads them from Firebase.
+    
+    Each worker process has its own cache and this only reaches the worker
+    that handles the request. The others keep serving their snapshot until
+    it is older than NGO_CACHE_TTL seconds and they reload it themselves.
+    """
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    _ngo_cache['data'] = None
+    _ngo_cache['generation'] += 1
+    return {"status": "invalidated", "scope": "worker", "max_stale_seconds": NGO_CACHE_TTL}
+
+@app.post("/nearby-ngos/", responses={200: {"model": NGOPage}})
 async def find_nearby_ngos(request: LocationRequest):
     """
     Get nearby NGOs based on user location
@@ -141,13 +319,20 @@ async def find_nearby_ngos(request: LocationRequest):
     - latitude: User's latitude
     - longitude: User's longitude
     - radius: Search radius in kilometers (optional, default: 50km)
+    - limit: Maximum number of NGOs to return (optional, default: 50, max: 200)
+    - cursor: next_cursor from the previous page (optional)
     
     Returns:
-    List of nearby NGOs sorted by distance
+    A page of nearby NGOs sorted by distance, the number of NGOs within the
+    radius, and the cursor of the next page
     """
+    offset = decode_cursor(request.cursor)
+    
     try:
-        nearby = get_nearby_ngos(request.latitude, request.longitude, request.radius)
-        return nearby
+        # Returned as a response directly so FastAPI doesn't validate and
+        # re-encode every NGO; NGOPage only documents the shape
+        page = await get_nearby_ngos(request.latitude, request.longitude, request.radius, offset, request.limit)
+        return ORJSONResponse(page)
     except Exception as e:
         print(f"Error in find_nearby_ngos: {str(e)}")  # Log the error
         raise HTTPException(
@@ -157,4 +342,6 @@ async def find_nearby_ngos(request: LocationRequest):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Multiple workers need the app as an import string, so each one imports it
+    uvicorn.run("recommendation:app", host="0.0.0.0", port=8000, workers=os.cpu_count(),
+                loop="uvloop", http="httptools", log_level="warning")
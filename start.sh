@@ -1,3 +1,3 @@
 #!/bin/bash
-uvicorn main:app --host 0.0.0.0 --port $PORT
-gunicorn main:app -c gunicorn_config.py 
\ No newline at end of file
+uvicorn main:app --host 0.0.0.0 --port $PORT --loop uvloop --http httptools
+gunicorn main:app -c gunicorn.conf.py 
\ No newline at end of file
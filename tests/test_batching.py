@@ -0,0 +1,37 @@
+import asyncio
+
+from batching import BatchAggregator
+
+
+def make_batcher(**kwargs):
+    calls = []
+
+    async def handler(context, items):
+        calls.append((context, items))
+        return [f"{context}: {item}" for item in items]
+
+    return BatchAggregator(handler, **kwargs), calls
+
+
+def test_full_batch_uses_the_first_requests_context():
+    batcher, calls = make_batcher(max_batch_size=2, window=60)
+
+    async def scenario():
+        return await asyncio.gather(batcher.submit("doc", "a", "first"), batcher.submit("doc", "b", "second"))
+
+    assert asyncio.run(scenario()) == ["first: a", "first: b"]
+    assert calls == [("first", ["a", "b"])]
+
+
+def test_batch_is_sent_when_the_window_ends():
+    batcher, calls = make_batcher(max_batch_size=8, window=0.01)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit("doc", "a", "first"),
+            batcher.submit("doc", "b", "second"),
+            batcher.submit("other", "c", "third"),
+        )
+
+    assert asyncio.run(scenario()) == ["first: a", "first: b", "third: c"]
+    assert sorted(calls) == [("first", ["a", "b"]), ("third", ["c"])]
@@ -0,0 +1,93 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from geo import (EQUIRECT_MAX_LATITUDE, EQUIRECT_MAX_RADIUS_KM, EQUIRECT_SLACK, bounding_box_mask,
+                 encode_geohash, equirect_distance_np, geohash_query_bounds, haversine_np)
+
+EARTH_RADIUS_KM = 6371.0
+
+CENTRES = [(19.0, 73.0), (0.0, 0.0), (-33.9, 151.2), (64.1, -21.9), (78.2, 15.6), (0.0, 179.999), (-10.0, -179.999)]
+RADII = [0.005, 0.05, 1, 5, 20, 50, 150, 600, 2500]
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def destination(lat, lon, bearing, distance):
+    """Point `distance` km away from (lat, lon) in the direction `bearing` (degrees)"""
+    lat1, lon1, theta = map(math.radians, (lat, lon, bearing))
+    d = distance / EARTH_RADIUS_KM
+    lat2 = math.asin(math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(theta))
+    lon2 = lon1 + math.atan2(math.sin(theta) * math.sin(d) * math.cos(lat1),
+                             math.cos(d) - math.sin(lat1) * math.sin(lat2))
+    # Rounded like stored coordinates; python-geohash misencodes latitudes
+    # like 1e-21 that the float maths produces near the equator
+    return round(math.degrees(lat2), 9), round((math.degrees(lon2) + 180) % 360 - 180, 9)
+
+
+def points_around(lat, lon, radius, count=300):
+    """Random points up to 1.5 * radius away, plus a ring just inside the radius"""
+    rng = random.Random(f"{lat},{lon},{radius}")
+    points = [destination(lat, lon, rng.uniform(0, 360), 1.5 * radius * math.sqrt(rng.random()))
+              for _ in range(count)]
+    points += [destination(lat, lon, bearing, 0.999 * radius) for bearing in range(0, 360, 5)]
+    return points
+
+
+@pytest.mark.parametrize("lat, lon", CENTRES)
+@pytest.mark.parametrize("radius", RADII)
+def test_geohash_ranges_cover_the_search_circle(lat, lon, radius):
+    bounds = geohash_query_bounds(lat, lon, radius)
+    if bounds is None:
+        return
+
+    for point in points_around(lat, lon, radius):
+        if haversine(lat, lon, *point) <= radius:
+            cell = encode_geohash(*point)
+            assert any(start <= cell < end for start, end in bounds), point
+
+
+def test_small_radii_use_geohash_ranges():
+    for lat, lon in CENTRES:
+        assert geohash_query_bounds(lat, lon, 50) is not None
+    assert geohash_query_bounds(19.0, 73.0, 5000) is None
+
+
+def test_equirect_slack_covers_the_approximation_error():
+    # Points exactly `radius` away in every direction, across the whole range
+    # the approximation is used in. Widening the radius by EQUIRECT_SLACK has
+    # to keep all of them.
+    for lat in np.linspace(-EQUIRECT_MAX_LATITUDE, EQUIRECT_MAX_LATITUDE, 29):
+        for radius in (0.1, 1, 10, 50, EQUIRECT_MAX_RADIUS_KM):
+            lats, lons = np.array([destination(lat, 30.0, bearing, radius) for bearing in range(0, 360, 3)]).T
+            exact = haversine_np(lat, 30.0, lats, lons)
+            approx = equirect_distance_np(lat, 30.0, lats, lons)
+            assert np.all(approx <= exact * EQUIRECT_SLACK)
+
+
+def test_equirect_distance_wraps_around_the_antimeridian():
+    lats, lons = np.array([[0.0, -179.95], [10.0, 179.95]]).T
+
+    assert np.allclose(equirect_distance_np(0.0, 179.95, lats, lons), haversine_np(0.0, 179.95, lats, lons), rtol=0.01)
+
+
+@pytest.mark.parametrize("lat, lon", CENTRES + [(89.5, 0.0), (-89.9, 120.0)])
+@pytest.mark.parametrize("radius", RADII)
+def test_bounding_box_keeps_every_point_in_the_circle(lat, lon, radius):
+    lats, lons = np.array(points_around(lat, lon, radius)).T
+    inside = haversine_np(lat, lon, lats, lons) <= radius
+
+    assert bounding_box_mask(lat, lon, radius, lats, lons)[inside].all()
+
+
+def test_bounding_box_drops_points_outside_it():
+    lats = np.array([19.5, 19.0, 18.5, 19.0])
+    lons = np.array([73.0, 73.5, 73.0, 72.5])
+
+    assert not bounding_box_mask(19.0, 73.0, 10, lats, lons).any()
@@ -0,0 +1,122 @@
+import asyncio
+import operator
+
+import numpy as np
+import pytest
+
+import main
+from geo import encode_geohash, haversine_np
+
+OPERATORS = {'>=': operator.ge, '<=': operator.le, '<': operator.lt}
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+def field_value(data, path):
+    for name in path.split('.'):
+        data = data.get(name) if isinstance(data, dict) else None
+    return data
+
+
+class FakeQuery:
+    """Supports the where / select / limit / stream calls main.py makes"""
+
+    def __init__(self, docs, filters, log):
+        self._docs = docs
+        self._filters = filters
+        self._log = log
+
+    def where(self, field, op, value):
+        return FakeQuery(self._docs, self._filters + [(field, op, value)], self._log)
+
+    def select(self, fields):
+        return self
+
+    def limit(self, count):
+        return FakeQuery(self._docs[:count], self._filters, self._log)
+
+    async def stream(self):
+        self._log.append(self._filters)
+        for doc in self._docs:
+            values = [field_value(doc.to_dict(), field) for field, _, _ in self._filters]
+            if all(value is not None and OPERATORS[op](value, bound)
+                   for value, (_, op, bound) in zip(values, self._filters)):
+                yield doc
+
+
+class FakeDB:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def collection(self, name):
+        return FakeQuery(self.docs, [], self.queries)
+
+
+def make_ngos():
+    rng = np.random.default_rng(0)
+    # 20 NGOs at the same spot, all at exactly the same distance
+    points = [(19.01, 73.01)] * 20
+    points += list(zip(rng.uniform(18.0, 20.0, 400), rng.uniform(72.0, 74.0, 400)))
+    docs = [
+        FakeSnapshot(f"ngo{i}", {
+            'ngoName': f"NGO {i}",
+            'location': {'latitude': lat, 'longitude': lon},
+            'geohash': encode_geohash(lat, lon),
+        })
+        for i, (lat, lon) in enumerate(points)
+    ]
+    docs.append(FakeSnapshot("nowhere", {'ngoName': "No location"}))
+    return docs, points
+
+
+@pytest.fixture
+def db(monkeypatch):
+    docs, points = make_ngos()
+    db = FakeDB(docs)
+    monkeypatch.setattr(main, 'db', db)
+    monkeypatch.setattr(main, 'firebase_initialized', True)
+    return db, points
+
+
+def fetch_all(radius, limit):
+    items, offset = [], 0
+    while True:
+        page = asyncio.run(main.get_nearby_ngos(19.0, 73.0, radius, offset, limit))
+        items += page['items']
+        if page['next_cursor'] is None:
+            return items
+        offset = main.decode_cursor(page['next_cursor'])
+
+
+def test_geohash_queries_find_every_ngo_in_the_radius(db):
+    db, points = db
+    lats, lons = np.array(points).T
+    expected = {f"ngo{i}" for i in np.nonzero(haversine_np(19.0, 73.0, lats, lons) <= 40)[0]}
+
+    items = fetch_all(radius=40, limit=7)
+    ids = [item['ngo_id'] for item in items]
+
+    assert len(ids) == len(set(ids))
+    assert set(ids) == expected
+    assert [item['distance'] for item in items] == sorted(item['distance'] for item in items)
+    assert db.queries and all(field == 'geohash' for filters in db.queries for field, _, _ in filters)
+
+
+def test_pages_are_filled_past_100_ngos(db):
+    db, points = db
+
+    first = asyncio.run(main.get_nearby_ngos(19.0, 73.0, 6000, 0, 200))
+    items = fetch_all(radius=6000, limit=200)
+
+    assert len(first['items']) == 200
+    assert first['next_cursor'] is not None
+    assert len(items) == len(points)
+    assert all(field == 'location.latitude' for filters in db.queries for field, _, _ in filters)
@@ -0,0 +1,49 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from middleware import CORSMiddleware
+
+app = FastAPI()
+app.add_middleware(CORSMiddleware)
+calls = []
+
+
+@app.get("/ping")
+async def ping():
+    calls.append("ping")
+    return {"ok": True}
+
+
+client = TestClient(app)
+
+
+def test_preflight_is_answered_by_the_middleware():
+    calls.clear()
+    response = client.options("/ping", headers={
+        "Origin": "https://example.com",
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type",
+    })
+
+    assert response.status_code == 204
+    assert response.headers["access-control-allow-origin"] == "https://example.com"
+    assert response.headers["access-control-allow-credentials"] == "true"
+    assert "POST" in response.headers["access-control-allow-methods"]
+    assert response.headers["access-control-allow-headers"] == "content-type"
+    assert calls == []
+
+
+def test_cors_headers_are_added_to_responses():
+    response = client.get("/ping", headers={"Origin": "https://example.com"})
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert response.headers["access-control-allow-origin"] == "https://example.com"
+    assert response.headers["vary"] == "Origin"
+
+
+def test_requests_without_origin_are_untouched():
+    response = client.get("/ping")
+
+    assert response.status_code == 200
+    assert "access-control-allow-origin" not in response.headers
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import recommendation
+from geo import bounding_box_mask, encode_geohash, haversine_np
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeQuery:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def select(self, fields):
+        return self
+
+    async def stream(self):
+        for doc in self._docs:
+            yield doc
+
+
+class FakeDB:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def collection(self, name):
+        return FakeQuery(self._docs)
+
+
+def make_ngos():
+    rng = np.random.default_rng(0)
+    # 500 NGOs at the same spot, all at exactly the same distance
+    points = [(19.01, 73.01)] * 500
+    points += list(zip(rng.uniform(18.5, 19.5, 300), rng.uniform(72.5, 73.5, 300)))
+    docs = [
+        FakeSnapshot(f"ngo{i}", {'ngoName': f"NGO {i}", 'location': {'latitude': lat, 'longitude': lon}})
+        for i, (lat, lon) in enumerate(points)
+    ]
+    docs.append(FakeSnapshot("nowhere", {'ngoName': "No location"}))
+    return docs, points
+
+
+@pytest.fixture
+def client(monkeypatch):
+    docs, points = make_ngos()
+    monkeypatch.setattr(recommendation, 'db', FakeDB(docs))
+    data = asyncio.run(recommendation._fetch_ngos())
+    monkeypatch.setitem(recommendation._ngo_cache, 'data', data)
+    monkeypatch.setitem(recommendation._ngo_cache, 'ts', time.monotonic())
+    # Not used as a context manager, so the Firebase startup hook doesn't run
+    return TestClient(recommendation.app), points
+
+
+def fetch_all(client, radius, limit):
+    items, cursor, totals = [], None, set()
+    while True:
+        response = client.post("/nearby-ngos/", json={
+            'latitude': 19.0, 'longitude': 73.0, 'radius': radius, 'limit': limit, 'cursor': cursor,
+        })
+        assert response.status_code == 200
+        page = response.json()
+        items += page['items']
+        totals.add(page['total'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return items, totals
+
+
+def test_pages_of_tied_ngos_do_not_overlap(client):
+    client, points = client
+    lats, lons = np.array(points).T
+    expected = {f"ngo{i}" for i in np.nonzero(haversine_np(19.0, 73.0, lats, lons) <= 30)[0]}
+
+    items, totals = fetch_all(client, radius=30, limit=20)
+    ids = [item['ngo_id'] for item in items]
+
+    assert len(ids) == len(set(ids))
+    assert set(ids) == expected
+    assert totals == {len(expected)}
+    assert [item['distance'] for item in items] == sorted(item['distance'] for item in items)
+
+
+def test_pages_are_the_same_on_every_request(client):
+    client, _ = client
+    first, _ = fetch_all(client, radius=30, limit=7)
+    second, _ = fetch_all(client, radius=30, limit=7)
+
+    assert first == second
+
+
+def test_invalidation_needs_the_admin_token(client, monkeypatch):
+    client, _ = client
+    monkeypatch.setattr(recommendation, 'ADMIN_TOKEN', "secret")
+
+    assert client.post("/admin/invalidate-ngos").status_code == 403
+    assert client.post("/admin/invalidate-ngos", headers={'X-Admin-Token': "wrong"}).status_code == 403
+    assert recommendation._ngo_cache['data'] is not None
+
+    response = client.post("/admin/invalidate-ngos", headers={'X-Admin-Token': "secret"})
+    assert response.status_code == 200
+    assert response.json() == {
+        'status': "invalidated", 'scope': "worker", 'max_stale_seconds': recommendation.NGO_CACHE_TTL,
+    }
+    assert recommendation._ngo_cache['data'] is None
+
+
+def points_near(rng, lat, lon, radius, count):
+    """Random points up to 1.5 * radius km away from (lat, lon)"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    theta = rng.uniform(0, 2 * np.pi, count)
+    d = 1.5 * radius * np.sqrt(rng.random(count)) / 6371.0
+    lat2 = np.arcsin(np.sin(lat1) * np.cos(d) + np.cos(lat1) * np.sin(d) * np.cos(theta))
+    lon2 = lon1 + np.arctan2(np.sin(theta) * np.sin(d) * np.cos(lat1), np.cos(d) - np.sin(lat1) * np.sin(lat2))
+    return np.degrees(lat2).round(9), ((np.degrees(lon2) + 180) % 360 - 180).round(9)
+
+
+def test_candidates_include_every_ngo_in_the_radius():
+    rng = np.random.default_rng(1)
+    searches = [(rng.uniform(-80, 80), rng.uniform(-180, 180), 10 ** rng.uniform(-2, 3.5)) for _ in range(60)]
+    searches += [(0.0, 179.99, 30.0), (45.0, -180.0, 5.0), (85.0, 10.0, 200.0)]
+
+    # Snapshot fields _candidate_indices reads, sorted by geohash like _fetch_ngos
+    lats, lons = map(np.concatenate, zip(*(points_near(rng, lat, lon, radius, 200) for lat, lon, radius in searches)))
+    geohashes = [encode_geohash(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    order = np.argsort(geohashes, kind='stable')
+    lats, lons = lats[order], lons[order]
+    ngos = {'meta': [{}] * len(order), 'geohashes': [geohashes[i] for i in order]}
+
+    for lat, lon, radius in searches:
+        candidates = recommendation._candidate_indices(ngos, lat, lon, radius)
+        in_box = candidates[bounding_box_mask(lat, lon, radius, lats[candidates], lons[candidates])]
+        expected = np.nonzero(haversine_np(lat, lon, lats, lons) <= radius)[0]
+
+        assert len(np.unique(candidates)) == len(candidates)
+        assert np.isin(expected, in_box).all(), (lat, lon, radius)
@@ -0,0 +1,37 @@
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor, paginate
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(40)) == 40
+
+
+def test_missing_cursor_starts_at_zero():
+    assert decode_cursor(None) == 0
+    assert decode_cursor("") == 0
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"abc").decode(),
+    base64.urlsafe_b64encode(b"-5").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(cursor)
+    assert exc_info.value.status_code == 400
+
+
+def test_paginate_links_to_the_next_page():
+    page = paginate(list(range(5)), 0, 2)
+    assert page["items"] == [0, 1]
+    assert decode_cursor(page["next_cursor"]) == 2
+
+    last = paginate(list(range(5)), 4, 2)
+    assert last["items"] == [4]
+    assert last["next_cursor"] is None
@@ -0,0 +1,30 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from main import ThreadLimiter
+
+
+def test_calls_are_rejected_once_the_queue_is_full():
+    limiter = ThreadLimiter(limit=1, max_waiting=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.create_task(limiter.run(release.wait, 5))
+        queued = asyncio.create_task(limiter.run(lambda: "queued"))
+        # Wait until the first call holds the only slot and the second is queued
+        while limiter._waiting == 0:
+            await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as exc_info:
+            await limiter.run(lambda: "rejected")
+
+        release.set()
+        return exc_info.value.status_code, await running, await queued
+
+    status, first, second = asyncio.run(scenario())
+    assert status == 503
+    assert first is True
+    assert second == "queued"
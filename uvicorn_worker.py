@@ -0,0 +1,5 @@
+from uvicorn.workers import UvicornWorker
+
+class UvloopWorker(UvicornWorker):
+    """Uvicorn worker that always runs on uvloop with the httptools parser"""
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}